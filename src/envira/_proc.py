@@ -0,0 +1,74 @@
+import subprocess
+import tempfile
+from typing import IO, Any, List, Optional, Tuple, Union
+
+
+def _read_spool(spool: IO[bytes], text: bool) -> Union[str, bytes]:
+    spool.seek(0)
+    data = spool.read()
+
+    return data.decode() if text else data
+
+
+def run(
+    cmd: Union[str, List[str]],
+    *,
+    capture_stdout: bool = False,
+    capture_stderr: bool = True,
+    merge_stderr: bool = False,
+    spool: bool = False,
+    input: Optional[Union[str, bytes]] = None,
+    text: bool = True,
+    **kwargs: Any,
+) -> Tuple[int, Any, Any]:
+    """
+    Run command and wait for it to finish
+
+    Streams that are not captured are routed to /dev/null, so their
+    output is never buffered in memory. With spool captured streams are
+    written by the child straight into temporary files and read back once
+    it exits, instead of being drained through pipes while it runs.
+
+    Args:
+        cmd (Union[str, List[str]]): Command with arguments
+        capture_stdout (bool): Return stdout of the command
+        capture_stderr (bool): Return stderr of the command
+        merge_stderr (bool): Redirect stderr into stdout
+        spool (bool): Capture output through temporary files
+        input (Optional[Union[str, bytes]]): Data sent to stdin
+        text (bool): Decode captured output as text
+        **kwargs: Extra arguments passed to subprocess.run
+
+    Returns:
+        Tuple[int, Any, Any]: Exit code, stdout and stderr
+    """
+    if merge_stderr:
+        stderr = subprocess.STDOUT
+    elif capture_stderr:
+        stderr = subprocess.PIPE
+    else:
+        stderr = subprocess.DEVNULL
+
+    stdout = subprocess.PIPE if capture_stdout else subprocess.DEVNULL
+
+    if not spool:
+        proc = subprocess.run(
+            cmd, input=input, stdout=stdout, stderr=stderr, text=text, **kwargs
+        )
+
+        return proc.returncode, proc.stdout, proc.stderr
+
+    with tempfile.TemporaryFile() as out_spool, tempfile.TemporaryFile() as err_spool:
+        proc = subprocess.run(
+            cmd,
+            input=input,
+            stdout=out_spool if capture_stdout else stdout,
+            stderr=err_spool if stderr == subprocess.PIPE else stderr,
+            text=text,
+            **kwargs,
+        )
+
+        out = _read_spool(out_spool, text) if capture_stdout else None
+        err = _read_spool(err_spool, text) if stderr == subprocess.PIPE else None
+
+    return proc.returncode, out, err
@@ -1,27 +1,33 @@
 import argparse
-from typing import Dict, Type
-
-import tomli
+import re
+from typing import TYPE_CHECKING, Dict, Type
 
 from envira.environment import EXEC_INFO, SYS_INFO, Environment, set_config_file
-from envira.git import GitLoader
-from envira.providers import BaseProvider, get_providers
 from envira.utils import is_path, is_url
 
+if TYPE_CHECKING:
+    from envira.providers import BaseProvider
+
+_MACRO_RE = re.compile(r"\$\{(distr_name|distr_ver|user|home)\}")
+
 
 class Configurator:
     env: Environment
-    providers: Dict[str, Type[BaseProvider]]
+    providers: Dict[str, Type["BaseProvider"]]
 
     def __init__(self, env: Environment) -> None:
-        self.env = env
+        from envira.providers import get_providers_by_key
 
-        self._prepare_providers()
+        self.env = env
+        self.providers = get_providers_by_key()
 
     def load(self, force: bool = False):
-        with open(self.env.config_path, "r") as f:  # type: ignore
-            prepared_raw_data = self._unfold_macro(f.read())
-            conf_obj = tomli.loads(prepared_raw_data)
+        import tomli
+
+        with open(self.env.config_path, "rb") as f:  # type: ignore
+            raw_data = f.read().decode()
+
+        conf_obj = tomli.loads(self._unfold_macro(raw_data))
 
         for section in self.providers:
             if section in conf_obj:
@@ -30,20 +36,19 @@ class Configurator:
                 if provider.apply(force=force, env=self.env):
                     return
 
-    def _prepare_providers(self) -> None:
-        self.providers = {
-            provider.section_key: provider
-            for provider in sorted(get_providers(), key=lambda x: x.priority)  # type: ignore
-        }
-
     @staticmethod
     def _unfold_macro(raw_data: str):
-        return (
-            raw_data.replace("${distr_name}", SYS_INFO.id_)
-            .replace("${distr_ver}", SYS_INFO.version)
-            .replace("${user}", EXEC_INFO.uname)
-            .replace("${home}", EXEC_INFO.uhome)
-        )
+        if "${" not in raw_data:
+            return raw_data
+
+        macros = {
+            "distr_name": SYS_INFO.id_,
+            "distr_ver": SYS_INFO.version,
+            "user": EXEC_INFO.uname,
+            "home": EXEC_INFO.uhome,
+        }
+
+        return _MACRO_RE.sub(lambda m: macros[m.group(1)], raw_data)
 
 
 def prepare_args() -> argparse.Namespace:
@@ -88,6 +93,8 @@ def main() -> int:
         set_config_file(args.config_name)
 
     if is_url(args.path_or_url):
+        from envira.git import GitLoader
+
         git_loader = GitLoader(args.path_or_url)
         git_loader.clone()
 
@@ -1,9 +1,11 @@
+import mmap
 import os
 import pwd
+import re
 import sys
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional, Union
+from typing import Optional, Tuple, Union
 
 
 @dataclass
@@ -30,6 +32,13 @@ class ExecInfo:
     config_file: Optional[str] = "envira.toml"
 
 
+_OS_RELEASE_KEYS = {
+    "id": "id_",
+    "version_id": "version",
+    "version_codename": "codename",
+}
+
+
 def _get_sys_info() -> SysInfo:
     if sys.platform != "linux":
         return SysInfo(os=sys.platform)
@@ -37,40 +46,70 @@ def _get_sys_info() -> SysInfo:
     obj = {"os": sys.platform}
 
     with open("/etc/os-release", "r") as f:
-        os_data = f.readlines()
+        for line in f:
+            k, v = (lambda tup: (tup[0].lower(), tup[2].strip().strip('"')))(
+                line.partition("=")
+            )
 
-    for line in os_data:
-        k, v = (lambda tup: (tup[0].lower(), tup[1].strip('"').strip()))(
-            line.split("=")
-        )
+            if k in _OS_RELEASE_KEYS:
+                obj[_OS_RELEASE_KEYS[k]] = v
 
-        if k == "id":
-            obj["id_"] = v
-        elif k == "version_codename":
-            obj["codename"] = v
-        elif k == "version_id":
-            obj["version"] = v
+                if len(obj) > len(_OS_RELEASE_KEYS):
+                    break
 
     obj["default_shell"] = os.environ["SHELL"]
 
     return SysInfo(**obj)
 
 
+def _lookup_passwd(
+    name: Optional[str] = None, uid: Optional[int] = None
+) -> Tuple[str, int]:
+    """
+    Find user name and uid in /etc/passwd, falling back to NSS on miss
+
+    Args:
+        name (Optional[str]): User name to look up
+        uid (Optional[int]): User id to look up, used when name is not set
+
+    Returns:
+        Tuple[str, int]: User name and uid
+    """
+    if name is not None:
+        pattern = rb"^(%s):[^:\n]*:(\d+):" % re.escape(name.encode())
+    else:
+        pattern = rb"^([^:\n]*):[^:\n]*:(%d):" % uid
+
+    try:
+        with open("/etc/passwd", "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as passwd:
+                match = re.search(pattern, passwd, re.MULTILINE)
+
+                if match:
+                    return match.group(1).decode(), int(match.group(2))
+
+    except (OSError, ValueError):
+        pass
+
+    entry = pwd.getpwnam(name) if name is not None else pwd.getpwuid(uid)  # type: ignore
+    return entry.pw_name, entry.pw_uid
+
+
 def _get_exec_info() -> ExecInfo:
     euid = os.geteuid()
-    euname = pwd.getpwuid(euid).pw_name
+    euname, _ = _lookup_passwd(uid=euid)
 
     uname = os.getenv("SUDO_USER", "")
     if uname:
-        uid = pwd.getpwnam(uname).pw_uid
+        _, uid = _lookup_passwd(name=uname)
 
     else:
         uid = os.getuid()
-        uname = pwd.getpwuid(uid).pw_name
+        uname, _ = _lookup_passwd(uid=uid)
 
-    exc_path = Path(os.path.curdir).absolute()
-    cache_path = Path("~/.cache/envira").expanduser().absolute()
     uhome = os.environ["HOME"]
+    exc_path = Path(os.getcwd())
+    cache_path = Path(f"{uhome}/.cache/envira")
 
     return ExecInfo(
         uname=uname,
@@ -105,13 +144,14 @@ class Environment:
 
     def _prepare(self, path: Path) -> None:
         if path.is_dir():
-            for path_obj in path.iterdir():
-                if path_obj.is_file() and path_obj.name == EXEC_INFO.config_file:
-                    self._config_path = path_obj.absolute()
-                    self._folder_path = path
+            candidate = path / EXEC_INFO.config_file  # type: ignore
+
+            if os.path.isfile(candidate):
+                self._config_path = candidate.absolute()
+                self._folder_path = path
+
+                self._prepared = True
 
-                    self._prepared = True
-                    break
             else:
                 print("Config file not found in provided path!")
                 return
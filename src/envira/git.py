@@ -1,53 +1,34 @@
-import subprocess
+import shutil
 from pathlib import Path
 
+from envira import _proc
 from envira.environment import EXEC_INFO
 
+_GIT_AVAILABLE = shutil.which("git") is not None
+
 
 class GitLoader:
     def __init__(self, repo_url: str) -> None:
         self.repo_url = repo_url
 
-        self._git_status = self._check_git_is_available()
+        self._git_status = _GIT_AVAILABLE
         self._is_cloned = False
 
-    @staticmethod
-    def _check_git_is_available() -> bool:
-        try:
-            proc = subprocess.Popen(
-                ["git", "--version"],
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-            )
-            proc.communicate()
-
-            if proc.returncode != 0:
-                return False
-
-        except OSError:
-            return False
-
-        return True
-
     def clone(self) -> None:
         if not self._git_status:
             print("Git is unavailable!")
+            return
 
         if not EXEC_INFO.cache_path.exists():
             EXEC_INFO.cache_path.mkdir(parents=True, exist_ok=True)
 
         print(f"Start cloning from {self.repo_url}")
 
-        proc = subprocess.Popen(
-            ["git", "clone", self.repo_url, self.folder_path],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
+        returncode, _, err = _proc.run(
+            ["git", "clone", self.repo_url, self.folder_path]
         )
 
-        _, err = proc.communicate()
-
-        if proc.returncode != 0:
+        if returncode != 0:
             print(f"Error while cloning remote repo: {err}")
             return
 
@@ -1,10 +1,25 @@
-from typing import List, Type
+from typing import Dict, List, Type
 
-from . import apt, env
 from ._base import BaseProvider
 
-__all__ = ["get_providers", "BaseProvider"]
+__all__ = ["get_providers", "get_providers_by_key", "BaseProvider"]
+
+_providers_by_key: Dict[str, Type[BaseProvider]] = {}
 
 
 def get_providers() -> List[Type[BaseProvider]]:
+    from . import apt, env
+
     return [apt.AptProvider, env.EnvProvider]
+
+
+def get_providers_by_key() -> Dict[str, Type[BaseProvider]]:
+    if not _providers_by_key:
+        _providers_by_key.update(
+            {
+                provider.section_key: provider
+                for provider in sorted(get_providers(), key=lambda x: x.priority)  # type: ignore
+            }
+        )
+
+    return _providers_by_key
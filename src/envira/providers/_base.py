@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
 from typing import Any, Dict, Generic, Optional, TypeVar, get_args
 
 from pydantic import BaseModel
@@ -15,8 +16,14 @@ class BaseProvider(ABC, Generic[_T_Pattern]):
     pattern: _T_Pattern
     section_key: str
 
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+
+        args = get_args(cls.__orig_bases__[0])  # type: ignore
+        if args:
+            cls.pattern = args[0]
+
     def __init__(self, section: Dict) -> None:
-        self.pattern = get_args(self.__orig_bases__[0])[0]  # type: ignore
         self.section = section
 
         self.validate()
@@ -34,12 +41,13 @@ class BaseProvider(ABC, Generic[_T_Pattern]):
         raise NotImplementedError
 
 
-class ProviderOperationResult(BaseModel):
-    cmd: Optional[str]
-    exit_code: Optional[int]
-    operation_log: Optional[str]
-    err: Optional[str]
-    data: Optional[Any]
+@dataclass
+class ProviderOperationResult:
+    cmd: Optional[str] = None
+    exit_code: Optional[int] = None
+    operation_log: Optional[str] = None
+    err: Optional[str] = None
+    data: Optional[Any] = None
 
 
 def provider_cmd_error(res: ProviderOperationResult) -> None:
@@ -1,5 +1,6 @@
+import mmap
 import os
-import subprocess
+import stat
 from pathlib import Path
 from typing import Dict, List, Optional, Union
 from urllib.error import URLError
@@ -8,7 +9,8 @@ from urllib.request import urlopen
 
 from pydantic import Field
 
-from envira.environment import EXEC_INFO, SYS_INFO
+from envira import _proc
+from envira.environment import SYS_INFO
 from envira.providers._base import (
     BasePattern,
     BaseProvider,
@@ -94,13 +96,13 @@ class AptProvider(BaseProvider[AptPattern]):
 
         if self.section_obj.install:
             if isinstance(self.section_obj.install[0], str):
-                for package in self.section_obj.install:
-                    res = self._apt_install(package)
-                    if res.err:
-                        provider_cmd_error(res)
-                        return 1
+                res = self._apt_install(self.section_obj.install)  # type: ignore
+                if res.err:
+                    provider_cmd_error(res)
+                    return 1
 
-                    print(f"Successfully installed {package}, version: {res.data}")
+                for package, version in res.data.items():  # type: ignore
+                    print(f"Successfully installed {package}, version: {version}")
 
             else:
                 raise NotImplementedError
@@ -108,9 +110,6 @@ class AptProvider(BaseProvider[AptPattern]):
     def _download_key(
         self, url: str, key_download_timeout: Union[float, int] = 10
     ) -> ProviderOperationResult:
-        key_file_path = EXEC_INFO.cache_path / (
-            urlparse(url).path.split("/")[-1] + ".temp.key"
-        )
         domain = urlparse(url).netloc
         gpg_key_path = Path(f"/usr/share/keyrings/envira-{domain}-keyring.gpg")
 
@@ -118,9 +117,8 @@ class AptProvider(BaseProvider[AptPattern]):
             os.remove(gpg_key_path)
 
         try:
-            gpg_bytes = urlopen(url, timeout=key_download_timeout).read()
-            with open(key_file_path, "wb") as f:
-                f.write(gpg_bytes)
+            with urlopen(url, timeout=key_download_timeout) as resp:
+                gpg_bytes = resp.read()
 
         except URLError as e:
             print(e.reason)
@@ -131,18 +129,14 @@ class AptProvider(BaseProvider[AptPattern]):
                 err=str(e.reason).split(" ", maxsplit=1)[1],
             )
 
-        cmd = f"gpg --dearmor -o {gpg_key_path} {key_file_path}"
+        cmd = f"gpg --dearmor -o {gpg_key_path}"
 
-        proc = subprocess.Popen(
-            cmd.split(), stdout=subprocess.PIPE, stderr=subprocess.PIPE
-        )
-
-        _, err = proc.communicate(gpg_bytes)
+        returncode, _, err = _proc.run(cmd.split(), input=gpg_bytes, text=False)
 
         return ProviderOperationResult(
             cmd=cmd,
-            exit_code=proc.returncode,
-            err=err if proc.returncode != 0 else "",
+            exit_code=returncode,
+            err=err.decode() if returncode != 0 else "",
             data=gpg_key_path.as_posix(),
         )
 
@@ -157,111 +151,122 @@ class AptProvider(BaseProvider[AptPattern]):
     ) -> ProviderOperationResult:
         source_file_path = Path(f"/etc/apt/sources.list.d/{source_list}")
 
-        repo_row = (
-            type_
-            + " "
-            + ("[signed-by=" + gpg_key_path + "] " if gpg_key_path else "")
-            + repo_url
-            + " "
-            + SYS_INFO.codename
-            + " "
-            + branch
-            + "\n"
-        )
+        signed_by = f"[signed-by={gpg_key_path}] " if gpg_key_path else ""
+        repo_row = f"{type_} {signed_by}{repo_url} {SYS_INFO.codename} {branch}\n"
 
-        if source_file_path.exists():
-            # TODO: если лишнее строчки, то удаляем
+        repo_row_b = repo_row.encode()
 
-            with open(source_file_path, "r") as f:
-                file_data = f.read()
+        with open(source_file_path, "a+b") as f:
+            if os.fstat(f.fileno()).st_size:
+                # TODO: если лишнее строчки, то удаляем
 
-            if repo_row in file_data:
-                return ProviderOperationResult()
+                repo_url_b = repo_url.encode()
 
-            if repo_url in file_data:
-                if not force:
-                    return ProviderOperationResult(
-                        err=f"Repo '{repo_url}' duplicated! Use -f/--force to fix."
-                    )
-                else:
-                    print(
-                        f"Found repo '{repo_url}' duplication, it will be overwritten!"
-                    )
-                    file_lines = file_data.splitlines()
-                    with open(source_file_path, "w") as f:
-                        for line in file_lines:
-                            if not repo_url in line:
-                                f.write(line + "\n")
-
-            with open(source_file_path, "a") as f:
-                f.write(repo_row)
-        else:
-            with open(source_file_path, "w") as f:
-                f.write(repo_row)
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as file_data:
+                    if file_data.find(repo_row_b) != -1:
+                        return ProviderOperationResult()
+
+                    if file_data.find(repo_url_b) != -1:
+                        if not force:
+                            return ProviderOperationResult(
+                                err=f"Repo '{repo_url}' duplicated! Use -f/--force to fix."
+                            )
+
+                        print(
+                            f"Found repo '{repo_url}' duplication, it will be overwritten!"
+                        )
+                        tmp_file_path = source_file_path.with_name(
+                            source_file_path.name + ".tmp"
+                        )
+                        source_stat = os.fstat(f.fileno())
+
+                        try:
+                            with open(tmp_file_path, "wb") as tmp_f:
+                                os.fchmod(
+                                    tmp_f.fileno(), stat.S_IMODE(source_stat.st_mode)
+                                )
+                                os.fchown(
+                                    tmp_f.fileno(),
+                                    source_stat.st_uid,
+                                    source_stat.st_gid,
+                                )
+
+                                for line in iter(file_data.readline, b""):
+                                    if repo_url_b not in line:
+                                        tmp_f.write(line.rstrip(b"\n") + b"\n")
+
+                                tmp_f.write(repo_row_b)
+
+                            os.replace(tmp_file_path, source_file_path)
+
+                        except BaseException:
+                            try:
+                                os.remove(tmp_file_path)
+                            except FileNotFoundError:
+                                pass
+
+                            raise
+
+                        return ProviderOperationResult()
+
+            f.write(repo_row_b)
 
         return ProviderOperationResult()
 
     def _apt_update(self) -> ProviderOperationResult:
         cmd = "apt-get update"
 
-        proc = subprocess.Popen(
-            cmd.split(),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-        )
-
-        out, err = proc.communicate()
+        returncode, out, err = _proc.run(cmd.split(), capture_stdout=True)
 
         return ProviderOperationResult(
-            cmd=cmd, exit_code=proc.returncode, err=err, operation_log=out
+            cmd=cmd, exit_code=returncode, err=err, operation_log=out
         )
 
     def _apt_upgrade(self) -> ProviderOperationResult:
         cmd = "apt-get upgrade -y"
 
-        proc = subprocess.Popen(
-            cmd.split(),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
+        returncode, out, err = _proc.run(
+            cmd.split(), capture_stdout=True, merge_stderr=True
         )
 
-        out, err = proc.communicate()
-
         return ProviderOperationResult(
-            cmd=cmd, exit_code=proc.returncode, err=err, operation_log=out
+            cmd=cmd, exit_code=returncode, err=err, operation_log=out
         )
 
-    def _apt_install(self, package: str) -> ProviderOperationResult:
-        cmd = f"apt-get install -y {package}"
+    def _apt_install(self, packages: List[str]) -> ProviderOperationResult:
+        cmd = "apt-get install -y " + " ".join(packages)
 
-        proc = subprocess.Popen(
-            cmd.split(), stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
-        )
+        returncode, _, err = _proc.run(cmd.split())
 
-        _, err = proc.communicate()
+        if returncode != 0:
+            return ProviderOperationResult(cmd=cmd, exit_code=returncode, err=err)
 
-        if proc.returncode != 0:
-            return ProviderOperationResult(cmd=cmd, exit_code=proc.returncode, err=err)
+        cmd = "apt-cache policy " + " ".join(packages)
 
-        cmd = f"apt-cache policy {package}"
+        returncode, out, err = _proc.run(cmd.split(), capture_stdout=True)
 
-        proc = subprocess.Popen(
-            cmd.split(), stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
-        )
+        if returncode != 0:
+            return ProviderOperationResult(cmd=cmd, exit_code=returncode, err=err)
 
-        out, err = proc.communicate()
+        # Stanza headers carry only the package name and a foreign arch,
+        # so requested specs are matched without "=ver", "/release", ":arch"
+        requested: Dict[str, List[str]] = {}
 
-        if proc.returncode != 0:
-            return ProviderOperationResult(cmd=cmd, exit_code=proc.returncode, err=err)
+        for package in packages:
+            name = package.split("=", 1)[0].split("/", 1)[0].split(":", 1)[0]
+            requested.setdefault(name, []).append(package)
 
-        version = ""
+        versions = dict.fromkeys(packages, "")
+        matched: List[str] = []
 
         for line in out.splitlines():
-            if "Installed" in line:
-                version = line.strip().split()[1]
+            if line and not line[0].isspace():
+                name = line.rstrip().rstrip(":").split(":", 1)[0]
+                matched = requested.get(name, [])
+            elif "Installed" in line:
+                for package in matched:
+                    versions[package] = line.strip().split()[1]
 
         return ProviderOperationResult(
-            cmd=cmd, exit_code=proc.returncode, err=err, data=version
+            cmd=cmd, exit_code=returncode, err=err, data=versions
         )
@@ -1,11 +1,15 @@
+import errno
+import functools
 import os
 import shutil
-import subprocess
+import stat
+import sys
 from pathlib import Path
 from typing import Dict, List, Optional, Union
 
-from pydantic import Field, constr, validator
+from pydantic import Field, validator
 
+from envira import _proc
 from envira.environment import EXEC_INFO, SYS_INFO, Environment
 from envira.providers._base import (
     BasePattern,
@@ -14,33 +18,172 @@ from envira.providers._base import (
     provider_cmd_error,
 )
 
+_COPY_BUFSIZE = 1024 * 1024
+_HAS_COPY_FILE_RANGE = hasattr(os, "copy_file_range")
+
+
+@functools.lru_cache(maxsize=256)
+def _realpath(path: str) -> str:
+    """
+    Resolve a path with user expansion, cached per process
+
+    Args:
+        path (str): Path to resolve
+
+    Returns:
+        str: Absolute path with symlinks resolved
+    """
+    return os.path.realpath(os.path.expanduser(path))
+
+
+def _has_shebang(path: str) -> bool:
+    """
+    Check that the file starts with a #! interpreter line
+
+    Args:
+        path (str): Script path
+
+    Returns:
+        bool: Has shebang, False if the file can not be read
+    """
+    try:
+        with open(path, "rb") as f:
+            return f.read(2) == b"#!"
+    except OSError:
+        return False
+
+
+def _copy_fd_range(in_fd: int, out_fd: int, size: int) -> int:
+    """
+    Copy file content in kernel with copy_file_range, then sendfile
+
+    Args:
+        in_fd (int): Source file descriptor
+        out_fd (int): Destination file descriptor
+        size (int): Source file size
+
+    Returns:
+        int: Number of bytes copied
+    """
+    global _HAS_COPY_FILE_RANGE
+
+    offset = 0
+
+    if _HAS_COPY_FILE_RANGE:
+        try:
+            while True:
+                sent = os.copy_file_range(  # type: ignore
+                    in_fd, out_fd, max(size - offset, _COPY_BUFSIZE), offset, offset
+                )
+                if sent == 0:
+                    return offset
+
+                offset += sent
+
+        except OSError as e:
+            if e.errno == errno.ENOSYS:
+                _HAS_COPY_FILE_RANGE = False
+
+            elif e.errno not in (errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP):
+                raise
+
+    os.lseek(out_fd, offset, os.SEEK_SET)
+    blocksize = min(max(size, 8 * 1024 * 1024), 2**30)
+
+    try:
+        while True:
+            sent = os.sendfile(out_fd, in_fd, offset, blocksize)
+            if sent == 0:
+                return offset
+
+            offset += sent
+
+    except OSError as e:
+        if e.errno not in (errno.EINVAL, errno.ENOSYS, errno.ENOTSOCK):
+            raise
+
+    return offset
+
+
+def _fastcopy(src: str, dst: str) -> None:
+    """
+    Copy file data and mode bits like shutil.copy, avoiding userspace buffers
+
+    Args:
+        src (str): Source file
+        dst (str): Destination file or directory
+
+    Raises:
+        shutil.SameFileError: Source and destination are the same file
+    """
+    if os.path.isdir(dst):
+        dst = os.path.join(dst, os.path.basename(src))
+
+    in_fd = os.open(src, os.O_RDONLY)
+    try:
+        src_stat = os.fstat(in_fd)
+
+        try:
+            dst_stat = os.stat(dst)
+        except FileNotFoundError:
+            pass
+        else:
+            if (src_stat.st_dev, src_stat.st_ino) == (dst_stat.st_dev, dst_stat.st_ino):
+                raise shutil.SameFileError(f"{src} and {dst} are the same file")
+
+        out_fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+        try:
+            offset = _copy_fd_range(in_fd, out_fd, src_stat.st_size)
+
+            if offset < src_stat.st_size:
+                os.lseek(in_fd, offset, os.SEEK_SET)
+                os.lseek(out_fd, offset, os.SEEK_SET)
+
+                with open(in_fd, "rb", closefd=False) as fsrc, open(
+                    out_fd, "wb", closefd=False
+                ) as fdst, memoryview(bytearray(_COPY_BUFSIZE)) as buf:
+                    while True:
+                        n = fsrc.readinto(buf)
+                        if not n:
+                            break
+
+                        fdst.write(buf[:n])
+
+        finally:
+            os.close(out_fd)
+
+    finally:
+        os.close(in_fd)
+
+    shutil.copymode(src, dst)
+
 
 class EnvCopyPattern(BasePattern):
     source: Path
     dest: Path
     as_link: bool = False
 
+    @validator("dest")
+    def normalize_dest(cls, v: Path) -> Path:
+        return v.expanduser().absolute()
+
 
 class EnvDirTreeSubtreePattern(BasePattern):
     name: str
-    mode: constr(min_length=1, max_length=4) = "755"  # type: ignore
+    mode: int = 0o755
     nested: List["EnvDirTreeSubtreePattern"] = Field(default_factory=list)
 
-    @validator("mode")
-    def validate_privileges(cls, v: str) -> str:
-        if "8" in v or "9" in v:
+    @validator("mode", pre=True)
+    def validate_privileges(cls, v: Union[str, int]) -> int:
+        try:
+            mode = int(str(v), base=8)
+        except ValueError:
             raise ValueError("Privileges code must be in range 0-7!")
 
-        if not v.startswith("0") and len(v) == 4:
-            raise ValueError("Privileges code must start with 0!")
-
-        if len(v) < 3:
-            v = v.rjust(3 - len(v), "0")
+        if not 0 <= mode <= 0o777:
+            raise ValueError("Privileges code must be in range 0-0777!")
 
-        if len(v) == 4:
-            v = v[1:]
-
-        return v
+        return mode
 
 
 class EnvExecPattern(BasePattern):
@@ -56,11 +199,21 @@ class EnvExecPattern(BasePattern):
             raise ValueError("Either only cmd or script path is required!")
         return cmd
 
+    @validator("script")
+    def normalize_script(cls, v: Optional[Path]) -> Optional[Path]:
+        if v is None:
+            return v
+        return v.expanduser().absolute()
+
 
 class EnvDirTreePattern(BasePattern):
     root: Path = Path("~/")
     tree: List[EnvDirTreeSubtreePattern] = Field(default_factory=list)
 
+    @validator("root", always=True)
+    def normalize_root(cls, v: Path) -> Path:
+        return v.expanduser().absolute()
+
 
 class EnvPattern(BasePattern):
     copy_: Optional[List[EnvCopyPattern]] = Field(alias="copy")
@@ -78,17 +231,23 @@ class EnvProvider(BaseProvider[EnvPattern]):
             return 1
 
         if self.section_obj.copy_:
-            for copy_ in self.section_obj.copy_:
-                print(
-                    ("Linking " if copy_.as_link else "Copying ")
-                    + f"'{copy_.source}' "
-                    + "to "
-                    + f"'{copy_.dest}'"
-                )
-                res = self._apply_copy(env, copy_, force)
-                if res.err:
-                    provider_cmd_error(res)
-                    return 1
+            log_lines = []
+
+            try:
+                for copy_ in self.section_obj.copy_:
+                    action = "Linking" if copy_.as_link else "Copying"
+                    log_lines.append(f"{action} '{copy_.source}' to '{copy_.dest}'\n")
+
+                    res = self._apply_copy(env, copy_, force)
+                    if res.err:
+                        break
+
+            finally:
+                sys.stdout.write("".join(log_lines))
+
+            if res.err:
+                provider_cmd_error(res)
+                return 1
 
         if self.section_obj.dirtree:
             section = self.section_obj.dirtree
@@ -102,9 +261,24 @@ class EnvProvider(BaseProvider[EnvPattern]):
             print("Directory structure builded!")
 
         if self.section_obj.exec_:
+            shells: Dict[str, str] = {}
+
+            for exec_ in self.section_obj.exec_:
+                if exec_.shell == SYS_INFO.default_shell or exec_.shell in shells:
+                    continue
+
+                abs_shell_path = shutil.which(exec_.shell)
+                if not abs_shell_path:
+                    provider_cmd_error(
+                        ProviderOperationResult(err=f"Unknown shell '{exec_.shell}'!")
+                    )
+                    return 1
+
+                shells[exec_.shell] = abs_shell_path
+
             print("Run scripts")
             for exec_ in self.section_obj.exec_:
-                res = self._apply_exec(env, exec_)
+                res = self._apply_exec(env, exec_, shells)
                 if res.err or res.exit_code != 0:
                     provider_cmd_error(res)
                     return 1
@@ -112,65 +286,68 @@ class EnvProvider(BaseProvider[EnvPattern]):
             print("All scripts are executed!")
 
     @staticmethod
-    def _path_relative(env: Environment, path: Path) -> bool:
+    def _path_relative(env: Environment, path: Union[Path, str]) -> bool:
         """
         Check that the path is in the current environment
 
         Args:
             env (Environment): Current environment
-            path (Path): Path
+            path (Union[Path, str]): Path
 
         Returns:
             bool: Is in the current environment
         """
-        if not path.is_absolute():
-            path = path.expanduser().absolute()
-
-        if env.folder_path not in path.parents:
-            return False
+        env_root = _realpath(os.fspath(env.folder_path)) + os.sep  # type: ignore
 
-        return True
+        return _realpath(os.fspath(path)).startswith(env_root)
 
     def _apply_copy(
         self, env: Environment, section: EnvCopyPattern, force: bool = False
     ) -> ProviderOperationResult:
-        source = env.folder_path / section.source
-        dest = section.dest.absolute()
+        source = os.path.join(env.folder_path, section.source)  # type: ignore
+        dest = os.fspath(section.dest)
 
         if not self._path_relative(env, source):
             return ProviderOperationResult(
                 err=f"Attempt to access a file outside of environment folder"
             )
 
-        if not source.exists():
-            return ProviderOperationResult(err=f"File {source.name} does not exist")
+        if not os.path.exists(source):
+            return ProviderOperationResult(
+                err=f"File {os.path.basename(source)} does not exist"
+            )
 
         if not section.as_link:
-            if dest.exists() and not force:
+            if not force and os.path.exists(dest):
                 return ProviderOperationResult(
                     err=f"File {dest} already exists! Use -f/--force to overwrite!"
                 )
 
             try:
-                shutil.copy(source, dest)
+                _fastcopy(source, dest)
             except shutil.SameFileError:
                 pass
             except OSError as e:
                 return ProviderOperationResult(err=str(e))
 
         else:
-            if (
-                (dest.exists() and not dest.is_symlink())
-                or (dest.is_symlink() and dest.resolve() != source)
-            ) and not force:
-                return ProviderOperationResult(
-                    err=f"File {dest} already exists! Use -f/--force to overwrite!"
-                )
-
-            if dest.is_symlink() and dest.resolve() == source:
-                return ProviderOperationResult()
+            try:
+                dest_stat = os.lstat(dest)
+            except FileNotFoundError:
+                dest_stat = None
+
+            if dest_stat is not None:
+                if stat.S_ISLNK(dest_stat.st_mode) and (
+                    os.readlink(dest) == source
+                    or os.path.realpath(dest) == _realpath(source)
+                ):
+                    return ProviderOperationResult()
+
+                if not force:
+                    return ProviderOperationResult(
+                        err=f"File {dest} already exists! Use -f/--force to overwrite!"
+                    )
 
-            if dest.exists():
                 os.remove(dest)
 
             os.symlink(source, dest)
@@ -178,24 +355,27 @@ class EnvProvider(BaseProvider[EnvPattern]):
         return ProviderOperationResult()
 
     def _apply_dirtree(self, section: EnvDirTreePattern) -> ProviderOperationResult:
-        def _walk(trees: List[EnvDirTreeSubtreePattern], cur_path: Path) -> None:
-            for tree in trees:
-                new_cur_path = cur_path / tree.name
-                if not new_cur_path.exists():
-                    new_cur_path.mkdir(mode=int(tree.mode, base=8))
-
-                if tree.nested:
-                    _walk(tree.nested, new_cur_path)
+        stack = [(os.fspath(section.root), section.tree)]
 
         try:
-            _walk(section.tree, section.root.expanduser().absolute())
+            while stack:
+                cur_path, trees = stack.pop()
+                for tree in trees:
+                    new_cur_path = os.path.join(cur_path, tree.name)
+                    try:
+                        os.mkdir(new_cur_path, tree.mode)
+                    except FileExistsError:
+                        pass
+
+                    if tree.nested:
+                        stack.append((new_cur_path, tree.nested))
         except Exception as e:
             return ProviderOperationResult(err=str(e))
 
         return ProviderOperationResult()
 
     def _apply_exec(
-        self, env: Environment, section: EnvExecPattern
+        self, env: Environment, section: EnvExecPattern, shells: Dict[str, str]
     ) -> ProviderOperationResult:
         if section.script:
             if not self._path_relative(env, section.script):
@@ -203,12 +383,12 @@ class EnvProvider(BaseProvider[EnvPattern]):
                     err="Attempt to access a file outside of environment folder"
                 )
 
-            cmd = section.script.absolute().as_posix()
+            cmd = section.script.as_posix()
 
         else:
             cmd = section.cmd
 
-        kwargs = {"env": {}, "shell": True}
+        kwargs = {"env": {}}
 
         if not section.as_root:
             kwargs["user"] = EXEC_INFO.uid
@@ -216,22 +396,41 @@ class EnvProvider(BaseProvider[EnvPattern]):
         if section.envs:
             kwargs["env"] = section.envs
 
-        if section.shell != SYS_INFO.default_shell:
-            abs_shell_path = shutil.which(section.shell)
-            if not abs_shell_path:
-                return ProviderOperationResult(err=f"Unknown shell '{section.shell}'!")
+        custom_shell = section.shell != SYS_INFO.default_shell
 
-            kwargs["env"]["SHELL"] = abs_shell_path
+        if custom_shell:
+            shell_path = shells[section.shell]
+            kwargs["env"]["SHELL"] = shell_path
 
-        proc = subprocess.Popen(
-            cmd, **kwargs, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
-        )
+        if not section.script:
+            args = cmd
+            kwargs["shell"] = True
+
+            if custom_shell:
+                kwargs["executable"] = shell_path
+
+        elif custom_shell:
+            args = [shell_path, cmd]
+
+        elif not _has_shebang(cmd):
+            args = ["/bin/sh", cmd]
+
+        else:
+            args = [cmd]
+
+        try:
+            returncode, out_b, err_b = _proc.run(
+                args, capture_stdout=True, spool=True, text=False, **kwargs
+            )
+        except OSError as e:
+            return ProviderOperationResult(cmd=cmd, err=str(e))
 
-        out, err = proc.communicate()
+        out = out_b.decode(errors="replace")
+        err = err_b.decode(errors="replace")
 
-        if proc.returncode != 0 and not err:
+        if returncode != 0 and not err:
             err = out
 
         return ProviderOperationResult(
-            cmd=cmd, err=err, operation_log=out, exit_code=proc.returncode
+            cmd=cmd, err=err, operation_log=out, exit_code=returncode
         )
@@ -1,15 +1,26 @@
+import functools
 import os
-from pathlib import Path
-from urllib.parse import urlparse
+import re
+
+_URL_RE = re.compile(r"[a-zA-Z][a-zA-Z0-9+.\-]*://[^/?#\s]")
 
 
 def is_url(url: str) -> bool:
-    try:
-        result = urlparse(url)
-        return all([result.scheme, result.netloc])
-    except:
-        return False
+    return _URL_RE.match(url) is not None
 
 
+@functools.lru_cache(maxsize=512)
 def is_path(path: str) -> bool:
-    return Path(path).expanduser().exists()
+    """
+    Check that the path exists
+
+    Results are cached, call is_path.cache_clear() after changing the
+    filesystem if the same path has to be checked again.
+
+    Args:
+        path (str): Path, may start with ~
+
+    Returns:
+        bool: Path exists
+    """
+    return os.path.exists(os.path.expanduser(path))